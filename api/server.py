@@ -1,10 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
+import asyncio
 import json
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, List, Dict, Any
+from utils.events import broker, format_sse
+from utils.snapshots import get_snapshot_store
+from utils.profiling import is_enabled as profiling_enabled, add_profiling_middleware
 
 app = FastAPI(
     title="阿里巴巴财务数据 API",
@@ -21,29 +26,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 剖析模式（PROFILING=1）下按比例抽样剖析请求，关闭时不注册中间件
+if profiling_enabled():
+    add_profiling_middleware(app)
+
 # 数据文件路径
 DATA_DIR = Path(__file__).parent.parent / "data"
 FINANCIAL_DATA_PATH = DATA_DIR / "financial_data.json"
 
-def load_financial_data() -> Dict[str, Any]:
-    """加载财务数据"""
+# SSE 心跳间隔（秒），用于保持空闲连接
+EVENT_HEARTBEAT_INTERVAL = 15
+
+def load_financial_data(as_of: Optional[str] = None) -> Dict[str, Any]:
+    """加载财务数据，指定 as_of 时从版本快照重建该时间点的数据"""
+    if as_of:
+        return load_snapshot("financial_data", as_of)
     try:
         with open(FINANCIAL_DATA_PATH, 'r', encoding='utf-8') as f:
             return json.load(f)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"无法加载财务数据: {str(e)}")
 
+def load_snapshot(dataset: str, as_of: str) -> Dict[str, Any]:
+    """从版本快照重建指定时间点的数据"""
+    try:
+        store = get_snapshot_store(dataset, create=False)
+        data = store.as_of(as_of) if store else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"无法加载历史快照: {str(e)}")
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"{as_of} 之前没有 {dataset} 的快照")
+    return data
+
 @app.get("/")
 async def root():
     """API 根路径"""
     return {"message": "阿里巴巴财务数据 API 服务正在运行"}
 
 @app.get("/api/v1/financial/annual/{fiscal_year}")
-async def get_annual_financial_data(fiscal_year: str):
+async def get_annual_financial_data(fiscal_year: str, as_of: Optional[str] = None):
     """获取指定财年的财务数据"""
     try:
         # 加载数据
-        financial_data = load_financial_data()
+        financial_data = load_financial_data(as_of)
         
         # 获取年度数据
         annual_data = financial_data.get('annual_data', {})
@@ -71,11 +98,11 @@ async def get_annual_financial_data(fiscal_year: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/financial/quarterly/{year_quarter}")
-async def get_quarterly_financial_data(year_quarter: str):
+async def get_quarterly_financial_data(year_quarter: str, as_of: Optional[str] = None):
     """获取指定季度的财务数据"""
     try:
         # 加载数据
-        financial_data = load_financial_data()
+        financial_data = load_financial_data(as_of)
         
         # 获取季度数据
         quarterly_data = financial_data.get('quarterly_data', {})
@@ -103,10 +130,10 @@ async def get_quarterly_financial_data(year_quarter: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/financial/available-periods")
-async def get_available_periods():
+async def get_available_periods(as_of: Optional[str] = None):
     """获取可用的财务报告期间"""
     try:
-        financial_data = load_financial_data()
+        financial_data = load_financial_data(as_of)
         
         # 收集所有可用的报告期间
         annual_periods = set()
@@ -130,9 +157,59 @@ async def get_available_periods():
             'annual_periods': sorted(list(annual_periods), reverse=True),
             'quarterly_periods': sorted(list(quarterly_periods), reverse=True)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/snapshots/{dataset}")
+async def get_snapshot_versions(dataset: str):
+    """获取数据集的快照版本列表"""
+    if not dataset.replace('_', '').isalnum():
+        raise HTTPException(status_code=400, detail=f"无效的数据集名称: {dataset}")
+    store = get_snapshot_store(dataset, create=False)
+    if store is None:
+        raise HTTPException(status_code=404, detail=f"没有 {dataset} 的快照")
+    try:
+        return {'dataset': dataset, 'versions': store.versions()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/v1/events")
+async def stream_events(request: Request):
+    """订阅数据更新通知（Server-Sent Events）
+
+    连接建立后先推送各数据集的最新状态，之后每次数据采集保存成功时推送
+    一条通知，包含数据集名称、版本号、collection_time 以及新增的报告期间。
+    """
+    async def event_generator():
+        # 在生成器内订阅，保证客户端提前断开时订阅与注销始终成对出现
+        queue = broker.subscribe()
+        try:
+            for event in broker.snapshot().values():
+                yield format_sse(event, event_type='snapshot')
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_INTERVAL)
+                    yield format_sse(event)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/v1/events/latest")
+async def get_latest_events():
+    """获取各数据集的最新更新通知"""
+    return broker.snapshot()
+
 def start_api_server():
     """启动 API 服务器"""
     print("启动 API 服务器...")
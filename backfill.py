@@ -0,0 +1,39 @@
+# backfill.py
+import argparse
+import asyncio
+from data_collector.backfill import HistoricalBackfillCollector
+
+async def run_backfill(start_date=None, end_date=None, chunk_days=None, max_concurrency=None, reset=False):
+    """回填历史行情和财务报表数据"""
+    print("开始回填历史数据...")
+    
+    collector = HistoricalBackfillCollector(
+        start_date=start_date,
+        end_date=end_date,
+        chunk_days=chunk_days,
+        max_concurrency=max_concurrency
+    )
+    result = await collector.collect(reset=reset)
+    
+    print("历史数据回填完成")
+    return result
+
+def positive_int(value):
+    """argparse 类型：正整数"""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"必须为正整数: {value}")
+    return number
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="回填阿里巴巴历史行情及财务报表数据")
+    parser.add_argument('--start', dest='start_date', help="起始日期 (YYYY-MM-DD)")
+    parser.add_argument('--end', dest='end_date', help="结束日期 (YYYY-MM-DD)，默认今天")
+    parser.add_argument('--chunk-days', type=positive_int, help="每个分片覆盖的天数")
+    parser.add_argument('--concurrency', dest='max_concurrency', type=positive_int, help="并行获取的分片数")
+    parser.add_argument('--reset', action='store_true', help="忽略检查点，重新获取全部分片")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(run_backfill(**vars(args)))
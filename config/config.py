@@ -35,6 +35,35 @@ COLLECTION_CONFIG = {
     'data_update_interval': 24 # 数据更新间隔（小时）
 }
 
+# 历史数据回填配置
+BACKFILL_CONFIG = {
+    'start_date': '2000-01-01',  # 回填起始日期
+    'chunk_days': 365,           # 每个分片覆盖的天数
+    'max_concurrency': 4,        # 并行获取的分片数
+    'output_dir': os.path.join(DATA_DIR, 'backfill'),  # 分片及检查点存储目录
+    'checkpoint_file': 'checkpoint.json'
+}
+
+# 版本快照配置
+SNAPSHOT_CONFIG = {
+    'dir': os.path.join(DATA_DIR, 'snapshots'),  # 快照存储目录
+    'checkpoint_interval': 10,  # 每隔多少个版本保存一次完整检查点
+    'compact_after_days': 30,   # 超过该天数的版本每天只保留最后一个
+    'cache_size': 8             # 每个数据集缓存的重建版本数
+}
+
+# 性能剖析配置（默认关闭）
+PROFILING_CONFIG = {
+    'enabled': os.getenv('PROFILING', '0') == '1',
+    'output_dir': os.getenv('PROFILING_DIR', os.path.join(DATA_DIR, 'profiles')),
+    'sample_interval': 0.005,    # 调用栈采样间隔（秒）
+    'request_sample_rate': float(os.getenv('PROFILING_REQUEST_SAMPLE_RATE', '0.1')),  # API 请求抽样比例
+    'tracemalloc': os.getenv('PROFILING_TRACEMALLOC', '0') == '1',  # 采集周期是否记录内存分配（会明显拉长各阶段耗时）
+    'request_tracemalloc': os.getenv('PROFILING_REQUEST_TRACEMALLOC', '0') == '1',  # 抽样请求是否记录内存分配（进程级，影响所有线程）
+    'tracemalloc_frames': 8,     # 每次分配保留的调用栈深度
+    'alloc_top': 30              # alloc_top.txt 中输出的分配点数量
+}
+
 # 代理配置
 PROXY_CONFIG = {
     'http': 'http://127.0.0.1:10809',  # 替换为你的代理地址
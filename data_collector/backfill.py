@@ -0,0 +1,297 @@
+# data_collector/backfill.py
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+import yfinance as yf
+import requests
+from .base import BaseCollector
+from config.config import STOCK_CONFIG, PROXY_CONFIG, ALPHA_VANTAGE_CONFIG, BACKFILL_CONFIG
+from utils.helpers import write_json_atomic
+
+STATEMENT_FUNCTIONS = {
+    'income_statement': 'INCOME_STATEMENT',
+    'balance_sheet': 'BALANCE_SHEET',
+    'cash_flow': 'CASH_FLOW'
+}
+
+# yfinance 在 raise_errors=True 时对“区间内没有数据”也会抛出异常，按这些提示区分
+NO_DATA_MESSAGES = ['No data found', 'No price data found', 'possibly delisted']
+
+
+class RateLimiter:
+    """按最小调用间隔限制请求频率（异步）"""
+
+    def __init__(self, calls_per_minute):
+        self.interval = 60.0 / calls_per_minute
+        self.last_call = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            delay = self.last_call + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.last_call = time.monotonic()
+
+
+class HistoricalBackfillCollector(BaseCollector):
+    """历史数据回填：按时间分片并行获取多年日线行情及全部财务报表
+
+    每个分片完成后原子写入独立文件并更新检查点，中断后重新运行会跳过
+    已完成的分片。回填结果不记录版本快照，也不广播更新通知。
+    """
+    notify_enabled = False
+
+    def __init__(self, start_date=None, end_date=None, chunk_days=None, max_concurrency=None):
+        super().__init__()
+        self.symbol = STOCK_CONFIG['symbol']
+        self.hk_symbol = STOCK_CONFIG['hk_symbol']
+        self.proxies = PROXY_CONFIG
+        self.api_key = ALPHA_VANTAGE_CONFIG['api_key']
+        self.base_url = ALPHA_VANTAGE_CONFIG['base_url']
+        self.start_date = start_date or BACKFILL_CONFIG['start_date']
+        self.end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+        self.chunk_days = BACKFILL_CONFIG['chunk_days'] if chunk_days is None else chunk_days
+        self.max_concurrency = BACKFILL_CONFIG['max_concurrency'] if max_concurrency is None else max_concurrency
+        if self.chunk_days <= 0:
+            raise ValueError(f"chunk_days 必须为正整数: {self.chunk_days}")
+        if self.max_concurrency <= 0:
+            raise ValueError(f"max_concurrency 必须为正整数: {self.max_concurrency}")
+        self.output_dir = BACKFILL_CONFIG['output_dir']
+        self.checkpoint_path = os.path.join(self.output_dir, BACKFILL_CONFIG['checkpoint_file'])
+        self.alpha_vantage_limiter = RateLimiter(ALPHA_VANTAGE_CONFIG['rate_limit']['calls_per_minute'])
+
+    async def collect(self, reset=False):
+        """执行回填，返回合并后的行情与财务数据"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        checkpoint = {} if reset else self._load_checkpoint()
+        completed = checkpoint.get('completed', {})
+        # 每个市场第一个有数据分片的起始日期，早于该日期的空分片视为上市前
+        first_data = checkpoint.get('first_data', {})
+
+        chunks = self._plan_chunks()
+        pending = [chunk for chunk in chunks if chunk['id'] not in completed]
+        print(f"回填共 {len(chunks)} 个分片，已完成 {len(chunks) - len(pending)} 个，待获取 {len(pending)} 个")
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        failed = []
+        empty_chunks = []
+
+        def store_chunk(chunk, data):
+            filename = f"{chunk['id']}.json"
+            write_json_atomic(os.path.join(self.output_dir, filename), data)
+            completed[chunk['id']] = filename
+            self._save_checkpoint(completed, first_data)
+            print(f"分片 {chunk['id']} 完成")
+
+        async def run_history_chunk(chunk):
+            async with semaphore:
+                try:
+                    data = await asyncio.to_thread(self._fetch_history, chunk)
+                except Exception as e:
+                    print(f"分片 {chunk['id']} 获取失败: {str(e)}")
+                    failed.append(chunk['id'])
+                    return
+                if not data['history']:
+                    # 空结果先不记录检查点，等确定是否早于上市日期后再处理
+                    empty_chunks.append((chunk, data))
+                    return
+                market = chunk['market']
+                if market not in first_data or chunk['start'] < first_data[market]:
+                    first_data[market] = chunk['start']
+                store_chunk(chunk, data)
+
+        async def run_statement_chunks(chunks):
+            # 报表分片单独顺序执行，不占用行情分片的并发名额；
+            # 频率限制紧挨着实际请求，保证请求间隔符合 Alpha Vantage 限制
+            for chunk in chunks:
+                await self.alpha_vantage_limiter.wait()
+                try:
+                    data = await asyncio.to_thread(self._fetch_statement, chunk)
+                except Exception as e:
+                    print(f"分片 {chunk['id']} 获取失败: {str(e)}")
+                    failed.append(chunk['id'])
+                    continue
+                store_chunk(chunk, data)
+
+        await asyncio.gather(
+            run_statement_chunks([chunk for chunk in pending if chunk['kind'] == 'statement']),
+            *(run_history_chunk(chunk) for chunk in pending if chunk['kind'] == 'history')
+        )
+
+        for chunk, data in empty_chunks:
+            first = first_data.get(chunk['market'])
+            if first and chunk['end'] < first:
+                store_chunk(chunk, data)
+            else:
+                print(f"分片 {chunk['id']} 返回空数据，未记录检查点，重新运行时会再次获取")
+                failed.append(chunk['id'])
+
+        if failed:
+            print(f"{len(failed)} 个分片获取失败，重新运行即可从检查点继续")
+
+        market_data, financial_data = self._merge_chunks(chunks, completed)
+        try:
+            print("正在保存回填数据...")
+            self.save_data(market_data, 'market_history_full.json')
+            self.save_data(financial_data, 'financial_statements_full.json')
+            print("回填数据保存完成")
+        except Exception as e:
+            print(f"保存数据失败: {str(e)}")
+
+        return market_data, financial_data
+
+    def _plan_chunks(self):
+        """按时间范围和报表类型划分分片"""
+        chunks = []
+        start = datetime.strptime(self.start_date, '%Y-%m-%d')
+        end = datetime.strptime(self.end_date, '%Y-%m-%d')
+        while start <= end:
+            chunk_end = min(start + timedelta(days=self.chunk_days - 1), end)
+            for market, symbol in [('us_market', self.symbol), ('hk_market', self.hk_symbol)]:
+                chunks.append({
+                    'id': f"{market}_{start:%Y%m%d}_{chunk_end:%Y%m%d}",
+                    'kind': 'history',
+                    'market': market,
+                    'symbol': symbol,
+                    'start': start.strftime('%Y-%m-%d'),
+                    'end': chunk_end.strftime('%Y-%m-%d')
+                })
+            start = chunk_end + timedelta(days=1)
+
+        # Alpha Vantage 每次调用返回全部年度和季度报表，因此每种报表一个分片
+        for report_type in STATEMENT_FUNCTIONS:
+            chunks.append({
+                'id': f"statement_{report_type}_{self.end_date.replace('-', '')}",
+                'kind': 'statement',
+                'report_type': report_type
+            })
+        return chunks
+
+    def _fetch_history(self, chunk):
+        """从 yfinance 获取指定时间段的日线数据"""
+        ticker = yf.Ticker(chunk['symbol'])
+        # yfinance 的 end 参数不包含当天
+        end = datetime.strptime(chunk['end'], '%Y-%m-%d') + timedelta(days=1)
+        # raise_errors=True 使网络错误、限流等异常进入失败流程，而不是返回空表被记录为完成
+        try:
+            hist = ticker.history(
+                start=chunk['start'],
+                end=end.strftime('%Y-%m-%d'),
+                proxy=self.proxies['https'],
+                raise_errors=True
+            )
+        except Exception as e:
+            if not any(message in str(e) for message in NO_DATA_MESSAGES):
+                raise
+            hist = None
+
+        history_data = []
+        if hist is not None and not hist.empty:
+            for date, row in hist.iterrows():
+                history_data.append({
+                    'Date': date.strftime('%Y-%m-%d'),
+                    'Open': float(row['Open']),
+                    'High': float(row['High']),
+                    'Low': float(row['Low']),
+                    'Close': float(row['Close']),
+                    'Volume': float(row['Volume'])
+                })
+
+        return {
+            'chunk': chunk,
+            'history': history_data,
+            'collection_time': datetime.now().isoformat(),
+            'data_source': 'yfinance'
+        }
+
+    def _fetch_statement(self, chunk):
+        """从 Alpha Vantage 获取全部年度及季度报表"""
+        params = {
+            'function': STATEMENT_FUNCTIONS[chunk['report_type']],
+            'symbol': self.symbol,
+            'apikey': self.api_key
+        }
+        response = requests.get(
+            self.base_url,
+            params=params,
+            proxies=self.proxies,
+            timeout=30
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        # 触发频率限制时 Alpha Vantage 返回 Note/Information 而不是报表
+        if 'annualReports' not in data and 'quarterlyReports' not in data:
+            raise ValueError(data.get('Note') or data.get('Information') or '返回数据中没有报表')
+
+        return {
+            'chunk': chunk,
+            'annual_reports': data.get('annualReports', []),
+            'quarterly_reports': data.get('quarterlyReports', []),
+            'collection_time': datetime.now().isoformat(),
+            'data_source': 'alpha_vantage'
+        }
+
+    def _merge_chunks(self, chunks, completed):
+        """合并已完成分片为完整的行情和财务数据"""
+        history = {'us_market': {}, 'hk_market': {}}
+        financial_data = {
+            'quarterly_data': {report_type: [] for report_type in STATEMENT_FUNCTIONS},
+            'annual_data': {report_type: [] for report_type in STATEMENT_FUNCTIONS},
+            'collection_time': datetime.now().isoformat(),
+            'data_source': 'alpha_vantage'
+        }
+
+        for chunk in chunks:
+            filename = completed.get(chunk['id'])
+            if not filename:
+                continue
+            with open(os.path.join(self.output_dir, filename), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            if chunk['kind'] == 'history':
+                for record in data.get('history', []):
+                    history[chunk['market']][record['Date']] = record
+            else:
+                financial_data['annual_data'][chunk['report_type']] = data.get('annual_reports', [])
+                financial_data['quarterly_data'][chunk['report_type']] = data.get('quarterly_reports', [])
+
+        market_data = {
+            market: {'history': sorted(records.values(), key=lambda x: x['Date'], reverse=True)}
+            for market, records in history.items()
+        }
+        market_data.update({
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'missing_chunks': [chunk['id'] for chunk in chunks if chunk['id'] not in completed],
+            'collection_time': datetime.now().isoformat(),
+            'data_source': 'yfinance'
+        })
+        return market_data, financial_data
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                    checkpoint = json.load(f)
+            except Exception as e:
+                print(f"检查点文件读取失败，将重新开始: {str(e)}")
+                return {}
+            # 只保留分片文件仍然存在的记录
+            checkpoint['completed'] = {
+                chunk_id: filename
+                for chunk_id, filename in checkpoint.get('completed', {}).items()
+                if os.path.exists(os.path.join(self.output_dir, filename))
+            }
+            return checkpoint
+        return {}
+
+    def _save_checkpoint(self, completed, first_data):
+        write_json_atomic(self.checkpoint_path, {
+            'completed': completed,
+            'first_data': first_data,
+            'updated_at': datetime.now().isoformat()
+        })
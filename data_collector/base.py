@@ -6,8 +6,17 @@ from datetime import datetime
 import json
 import os
 from config.config import DATA_DIR
+from utils.events import broker, extract_periods
+from utils.helpers import write_json_atomic
+from utils.snapshots import get_snapshot_store
+from utils.profiling import profile_stage
 
 class BaseCollector(ABC):
+    # 是否为保存的数据记录版本快照（仅 API 提供 as_of 查询的数据集开启）
+    snapshot_enabled = False
+    # 是否在保存后广播数据更新通知
+    notify_enabled = True
+    
     def __init__(self):
         self.session = None
         
@@ -21,10 +30,43 @@ class BaseCollector(ABC):
             self.session = None
     
     def save_data(self, data, filename):
-        """保存数据到JSON文件"""
+        """保存数据到JSON文件，按需记录版本快照并广播数据更新通知"""
         filepath = os.path.join(DATA_DIR, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with profile_stage(f'save_data.{filename}'):
+            try:
+                with profile_stage('load_previous'):
+                    previous_periods = extract_periods(self.load_data(filename))
+            except Exception:
+                previous_periods = set()
+            with profile_stage('write_json'):
+                write_json_atomic(filepath, data)
+            snapshot = None
+            if self.snapshot_enabled:
+                with profile_stage('snapshot'):
+                    snapshot = self.record_snapshot(filename, data)
+            if self.notify_enabled:
+                with profile_stage('notify'):
+                    self.notify_update(filename, data, previous_periods, snapshot)
+    
+    def record_snapshot(self, filename, data):
+        """记录数据集的版本快照，用于按时间点回溯"""
+        try:
+            return get_snapshot_store(os.path.splitext(filename)[0]).record(data)
+        except Exception as e:
+            print(f"记录数据快照失败: {str(e)}")
+            return None
+    
+    def notify_update(self, filename, data, previous_periods, snapshot=None):
+        """通知订阅者数据集已更新"""
+        try:
+            broker.publish(
+                dataset=os.path.splitext(filename)[0],
+                collection_time=data.get('collection_time'),
+                added_periods=extract_periods(data) - previous_periods,
+                version=snapshot['version'] if snapshot else None
+            )
+        except Exception as e:
+            print(f"发布数据更新通知失败: {str(e)}")
     
     def load_data(self, filename):
         """从JSON文件加载数据"""
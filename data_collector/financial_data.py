@@ -5,10 +5,13 @@ import pandas as pd
 from datetime import datetime
 from .base import BaseCollector
 from config.config import STOCK_CONFIG, PROXY_CONFIG, ALPHA_VANTAGE_CONFIG
+from utils.profiling import profile_stage
 import time
 import random
 
 class FinancialDataCollector(BaseCollector):
+    snapshot_enabled = True
+    
     def __init__(self):
         super().__init__()
         self.symbol = STOCK_CONFIG['symbol']
@@ -29,7 +32,8 @@ class FinancialDataCollector(BaseCollector):
             try:
                 print(f"尝试从 {source.__name__} 获取财务数据...")
                 time.sleep(random.uniform(1, 3))
-                financial_data = source()
+                with profile_stage(f'financial.{source.__name__}'):
+                    financial_data = source()
                 if financial_data and self._validate_data(financial_data):
                     print(f"成功从 {source.__name__} 获取财务数据")
                     all_financial_data.append(financial_data)
@@ -40,7 +44,8 @@ class FinancialDataCollector(BaseCollector):
                 continue
         
         if all_financial_data:
-            merged_data = self._merge_financial_data(all_financial_data)
+            with profile_stage('financial._merge_financial_data'):
+                merged_data = self._merge_financial_data(all_financial_data)
             try:
                 print("正在保存合并后的财务数据...")
                 self.save_data(merged_data, 'financial_data.json')
@@ -56,35 +61,41 @@ class FinancialDataCollector(BaseCollector):
         try:
             ticker = yf.Ticker(self.symbol)
             
-            # 获取季度财务报表
-            quarterly_financials = ticker.quarterly_financials
-            quarterly_balance_sheet = ticker.quarterly_balance_sheet
-            quarterly_cashflow = ticker.quarterly_cashflow
-            
-            # 获取年度财务报表
-            annual_financials = ticker.financials
-            annual_balance_sheet = ticker.balance_sheet
-            annual_cashflow = ticker.cashflow
-            
-            # 获取收益预估
-            earnings = ticker.earnings
-            earnings_dates = ticker.earnings_dates
+            with profile_stage('yfinance.request'):
+                # 获取季度财务报表
+                quarterly_financials = ticker.quarterly_financials
+                quarterly_balance_sheet = ticker.quarterly_balance_sheet
+                quarterly_cashflow = ticker.quarterly_cashflow
+                
+                # 获取年度财务报表
+                annual_financials = ticker.financials
+                annual_balance_sheet = ticker.balance_sheet
+                annual_cashflow = ticker.cashflow
+                
+                # 获取收益预估
+                earnings = ticker.earnings
+                earnings_dates = ticker.earnings_dates
             
-            return {
-                'quarterly_data': {
+            with profile_stage('yfinance.to_dict'):
+                quarterly_data = {
                     'income_statement': quarterly_financials.reset_index().to_dict(orient='records') if not quarterly_financials.empty else [],
                     'balance_sheet': quarterly_balance_sheet.reset_index().to_dict(orient='records') if not quarterly_balance_sheet.empty else [],
                     'cash_flow': quarterly_cashflow.reset_index().to_dict(orient='records') if not quarterly_cashflow.empty else []
-                },
-                'annual_data': {
+                }
+                annual_data = {
                     'income_statement': annual_financials.reset_index().to_dict(orient='records') if not annual_financials.empty else [],
                     'balance_sheet': annual_balance_sheet.reset_index().to_dict(orient='records') if not annual_balance_sheet.empty else [],
                     'cash_flow': annual_cashflow.reset_index().to_dict(orient='records') if not annual_cashflow.empty else []
-                },
-                'earnings': {
+                }
+                earnings_data = {
                     'historical': earnings.to_dict(orient='records') if not earnings.empty else [],
                     'upcoming': earnings_dates.reset_index().to_dict(orient='records') if not earnings_dates.empty else []
-                },
+                }
+            
+            return {
+                'quarterly_data': quarterly_data,
+                'annual_data': annual_data,
+                'earnings': earnings_data,
                 'key_metrics': self._calculate_key_metrics(ticker),
                 'collection_time': datetime.now().isoformat(),
                 'data_source': 'yfinance'
@@ -141,14 +152,16 @@ class FinancialDataCollector(BaseCollector):
             'apikey': self.api_key
         }
         
-        response = requests.get(
-            self.base_url,
-            params=params,
-            proxies=self.proxies,
-            timeout=10
-        )
+        with profile_stage('alpha_vantage.request'):
+            response = requests.get(
+                self.base_url,
+                params=params,
+                proxies=self.proxies,
+                timeout=10
+            )
         response.raise_for_status()
-        return response.json()
+        with profile_stage('alpha_vantage.json'):
+            return response.json()
 
     def _merge_financial_data(self, data_list):
         """合并来自不同数据源的财务数据"""
@@ -5,10 +5,13 @@ import pandas as pd
 from datetime import datetime, timedelta
 from .base import BaseCollector
 from config.config import STOCK_CONFIG, PROXY_CONFIG, ALPHA_VANTAGE_CONFIG
+from utils.profiling import profile_stage
 import time
 import random
 
 class MarketDataCollector(BaseCollector):
+    snapshot_enabled = True
+    
     def __init__(self):
         super().__init__()
         self.symbol = STOCK_CONFIG['symbol']
@@ -33,7 +36,8 @@ class MarketDataCollector(BaseCollector):
                 print(f"尝试从 {source.__name__} 获取数据...")
                 # 添加随机延迟，避免请求过快
                 time.sleep(random.uniform(1, 3))
-                market_data = source()
+                with profile_stage(f'market.{source.__name__}'):
+                    market_data = source()
                 if market_data and self._validate_data(market_data):
                     print(f"成功从 {source.__name__} 获取数据")
                     break
@@ -58,15 +62,20 @@ class MarketDataCollector(BaseCollector):
         us_ticker = yf.Ticker(self.symbol)
         hk_ticker = yf.Ticker(self.hk_symbol)
         
-        us_hist = us_ticker.history(period="1y", proxy=self.proxies['https'])
-        time.sleep(1)
-        hk_hist = hk_ticker.history(period="1y", proxy=self.proxies['https'])
+        with profile_stage('yfinance.request'):
+            us_hist = us_ticker.history(period="1y", proxy=self.proxies['https'])
+            time.sleep(1)
+            hk_hist = hk_ticker.history(period="1y", proxy=self.proxies['https'])
+            
+            us_info = us_ticker.info if hasattr(us_ticker, 'info') else {}
         
-        us_info = us_ticker.info if hasattr(us_ticker, 'info') else {}
+        with profile_stage('yfinance.to_dict'):
+            us_history = us_hist.reset_index().to_dict(orient='records') if not us_hist.empty else []
+            hk_history = hk_hist.reset_index().to_dict(orient='records') if not hk_hist.empty else []
         
         return {
             'us_market': {
-                'history': us_hist.reset_index().to_dict(orient='records') if not us_hist.empty else [],
+                'history': us_history,
                 'info': {
                     'market_cap': us_info.get('marketCap'),
                     'pe_ratio': us_info.get('trailingPE'),
@@ -75,7 +84,7 @@ class MarketDataCollector(BaseCollector):
                 } if us_info else {}
             },
             'hk_market': {
-                'history': hk_hist.reset_index().to_dict(orient='records') if not hk_hist.empty else []
+                'history': hk_history
             },
             'collection_time': datetime.now().isoformat(),
             'data_source': 'yfinance'
@@ -92,14 +101,16 @@ class MarketDataCollector(BaseCollector):
                 'apikey': self.api_key
             }
             
-            response = requests.get(
-                self.base_url,
-                params=params,
-                proxies=self.proxies,
-                timeout=10  # 添加超时设置
-            )
+            with profile_stage('alpha_vantage.request'):
+                response = requests.get(
+                    self.base_url,
+                    params=params,
+                    proxies=self.proxies,
+                    timeout=10  # 添加超时设置
+                )
             response.raise_for_status()  # 检查响应状态
-            us_data = response.json()
+            with profile_stage('alpha_vantage.json'):
+                us_data = response.json()
             
             time.sleep(12)  # Alpha Vantage API 限制
             
@@ -110,14 +121,16 @@ class MarketDataCollector(BaseCollector):
                 'apikey': self.api_key
             }
             
-            response = requests.get(
-                self.base_url,
-                params=params,
-                proxies=self.proxies,
-                timeout=10
-            )
+            with profile_stage('alpha_vantage.request'):
+                response = requests.get(
+                    self.base_url,
+                    params=params,
+                    proxies=self.proxies,
+                    timeout=10
+                )
             response.raise_for_status()
-            us_info = response.json()
+            with profile_stage('alpha_vantage.json'):
+                us_info = response.json()
             
             # 处理数据
             history_data = []
@@ -8,21 +8,24 @@ from datetime import datetime
 import json
 from config.config import DATA_DIR
 from api.server import start_api_server
+from utils.profiling import profile_run
 import threading
 
 async def collect_data():
     """收集市场和财务数据"""
     print("开始收集数据...")
     
-    # 创建数据收集器实例
-    market_collector = MarketDataCollector()
-    financial_collector = FinancialDataCollector()
-    
-    # 并行收集数据
-    market_data, financial_data = await asyncio.gather(
-        market_collector.collect(),
-        financial_collector.collect()
-    )
+    # 开启剖析模式（PROFILING=1）时记录本次采集周期各阶段耗时
+    with profile_run('collection'):
+        # 创建数据收集器实例
+        market_collector = MarketDataCollector()
+        financial_collector = FinancialDataCollector()
+        
+        # 并行收集数据
+        market_data, financial_data = await asyncio.gather(
+            market_collector.collect(),
+            financial_collector.collect()
+        )
     
     print("数据收集完成")
     return market_data, financial_data
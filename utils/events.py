@@ -0,0 +1,109 @@
+# utils/events.py
+import asyncio
+import json
+import threading
+from datetime import datetime
+
+
+def extract_periods(data):
+    """提取数据集中包含的报告期间/交易日期，用于计算新增期间"""
+    periods = set()
+    if not data:
+        return periods
+
+    # 财务数据：年度/季度报表的 fiscalDateEnding
+    for period in ['annual_data', 'quarterly_data']:
+        for reports in (data.get(period) or {}).values():
+            for report in reports:
+                date = report.get('fiscalDateEnding') or report.get('Date')
+                if date:
+                    periods.add(f"{period.split('_')[0]}:{str(date)[:10]}")
+
+    # 市场数据：各市场历史行情的交易日期
+    for market in ['us_market', 'hk_market']:
+        for record in (data.get(market) or {}).get('history', []):
+            date = record.get('Date')
+            if date:
+                periods.add(f"{market}:{str(date)[:10]}")
+
+    return periods
+
+
+class EventBroker:
+    """数据更新事件广播器
+
+    订阅者运行在 API 服务器的事件循环中，每个订阅者只持有一个有界队列，
+    因此大量空闲连接的开销很小。publish 可以在任意线程中调用（数据采集
+    与 API 服务器运行在不同线程），事件会被投递到 API 服务器的事件循环。
+    """
+
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self.loop = None
+        self.subscribers = set()
+        self.versions = {}
+        self.latest = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """注册订阅者，必须在 API 服务器的事件循环中调用"""
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """注销订阅者"""
+        self.subscribers.discard(queue)
+
+    def publish(self, dataset, collection_time=None, added_periods=None, version=None):
+        """发布数据集更新通知（线程安全），未指定版本号时自动递增"""
+        with self._lock:
+            version = version or self.versions.get(dataset, 0) + 1
+            self.versions[dataset] = version
+            event = {
+                'dataset': dataset,
+                'version': version,
+                'collection_time': collection_time,
+                'added_periods': sorted(added_periods or []),
+                'published_at': datetime.now().isoformat()
+            }
+            self.latest[dataset] = event
+
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return event
+
+        try:
+            if loop is asyncio.get_running_loop():
+                self._dispatch(event)
+                return event
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(self._dispatch, event)
+        return event
+
+    def _dispatch(self, event):
+        """将事件分发给所有订阅者，队列已满的慢订阅者会丢弃最旧的事件"""
+        for queue in list(self.subscribers):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    def snapshot(self):
+        """获取每个数据集的最新通知"""
+        with self._lock:
+            return dict(self.latest)
+
+
+def format_sse(event, event_type='update'):
+    """将事件格式化为 SSE 消息"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['dataset']}:{event['version']}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+# 全局广播器实例，数据采集与 API 服务器共享
+broker = EventBroker()
@@ -0,0 +1,349 @@
+# utils/profiling.py
+"""采集周期与 API 请求的性能剖析
+
+通过环境变量 PROFILING=1 开启。关闭时 profile_stage 只返回一个共享的空上下文，
+API 中间件也不会注册，因此几乎没有额外开销。
+
+每个采集周期（或被抽样的 API 请求）输出一个目录，包含：
+- stages.json：各阶段的调用次数、墙钟时间和 CPU 时间
+- stages.folded：按阶段嵌套关系汇总的墙钟时间（微秒）
+- cpu.folded：定时采样的调用栈
+- alloc.folded / alloc_top.txt：tracemalloc 记录的内存分配（周期结束时仍存活的分配）
+
+tracemalloc 会显著拉长各阶段耗时，默认关闭，需要内存分配记录时设置
+PROFILING_TRACEMALLOC=1（采集周期）或 PROFILING_REQUEST_TRACEMALLOC=1（抽样请求），
+并单独运行一次，不要与耗时对比混用。
+
+*.folded 为 flamegraph.pl / speedscope 可直接读取的折叠栈格式。
+比较两次运行：python -m utils.profiling compare <目录A> <目录B>
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from config.config import PROFILING_CONFIG
+
+_NULL_CONTEXT = nullcontext()
+_active_profiler = contextvars.ContextVar('active_profiler', default=None)
+_stage_path = contextvars.ContextVar('stage_path', default=())
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+class StackSampler(threading.Thread):
+    """定时采样目标线程的调用栈"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """通知采样线程停止，需要结果时再调用 join 等待其退出"""
+        self._stop_event.set()
+
+
+class Profiler:
+    """单次采集周期或单个请求的剖析记录"""
+
+    def __init__(self, label, trace_memory=False):
+        self.label = label
+        self.trace_memory = trace_memory
+        self.started_at = datetime.now()
+        self.stages = {}
+        self.sampler = None
+        self.memory_peak = None
+        self.alloc_stats = []
+
+    def start(self):
+        self.sampler = StackSampler(threading.get_ident(), PROFILING_CONFIG['sample_interval'])
+        self.sampler.start()
+        if self.trace_memory:
+            _start_tracemalloc()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+
+    def stop(self):
+        """结束计时并通知采样线程停止，不做耗时操作"""
+        self.add_stage((self.label,), time.perf_counter() - self._wall_start, time.thread_time() - self._cpu_start)
+        self.sampler.stop()
+
+    def finish(self):
+        """等待采样线程退出、汇总内存分配并写入结果，返回输出目录"""
+        self.sampler.join()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.memory_peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            self.alloc_stats = snapshot.statistics('traceback')
+        if self.trace_memory:
+            _stop_tracemalloc()
+        return self.write()
+
+    def add_stage(self, path, wall, cpu):
+        stage = self.stages.setdefault(';'.join(path), {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+        stage['count'] += 1
+        stage['wall'] += wall
+        stage['cpu'] += cpu
+
+    def write(self):
+        """写入剖析结果，返回输出目录"""
+        name = f"{self.started_at:%Y%m%d_%H%M%S_%f}_{_safe_name(self.label)}"
+        directory = os.path.join(PROFILING_CONFIG['output_dir'], name)
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, 'stages.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'label': self.label,
+                'started_at': self.started_at.isoformat(),
+                'memory_peak': self.memory_peak,
+                'stages': self.stages
+            }, f, ensure_ascii=False, indent=2)
+
+        # 阶段火焰图使用自身耗时（扣除子阶段），单位微秒
+        self_wall = {path: stage['wall'] for path, stage in self.stages.items()}
+        for path, stage in self.stages.items():
+            parent = path.rsplit(';', 1)[0] if ';' in path else None
+            if parent in self_wall:
+                self_wall[parent] -= stage['wall']
+        _write_folded(os.path.join(directory, 'stages.folded'),
+                      {path: int(max(wall, 0) * 1e6) for path, wall in self_wall.items()})
+
+        _write_folded(os.path.join(directory, 'cpu.folded'), self.sampler.samples)
+
+        if self.alloc_stats:
+            alloc = Counter()
+            for stat in self.alloc_stats:
+                frames = [f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+                alloc[';'.join(frames)] += stat.size
+            _write_folded(os.path.join(directory, 'alloc.folded'), alloc)
+            with open(os.path.join(directory, 'alloc_top.txt'), 'w', encoding='utf-8') as f:
+                for stat in self.alloc_stats[:PROFILING_CONFIG['alloc_top']]:
+                    f.write(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                    for line in stat.traceback.format(most_recent_first=True):
+                        f.write(f"{line}\n")
+                    f.write("\n")
+
+        return directory
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILING_CONFIG['tracemalloc_frames'])
+            # 只在没有其他剖析使用时重置峰值，避免破坏正在进行的剖析
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _safe_name(label):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in label)[:80]
+
+
+def _write_folded(filepath, counts):
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(counts.items()):
+            if count > 0:
+                f.write(f"{stack} {count}\n")
+
+
+def is_enabled():
+    return PROFILING_CONFIG['enabled']
+
+
+def _begin_run(label, trace_memory):
+    profiler = Profiler(label, trace_memory)
+    tokens = (_active_profiler.set(profiler), _stage_path.set((label,)))
+    profiler.start()
+    return profiler, tokens
+
+
+def _end_run(profiler, tokens):
+    profiler.stop()
+    _active_profiler.reset(tokens[0])
+    _stage_path.reset(tokens[1])
+
+
+def _finish_run(profiler):
+    try:
+        print(f"剖析结果已保存: {profiler.finish()}")
+    except Exception as e:
+        print(f"保存剖析结果失败: {str(e)}")
+
+
+@contextmanager
+def _profile_run(label):
+    profiler, tokens = _begin_run(label, PROFILING_CONFIG['tracemalloc'])
+    try:
+        yield profiler
+    finally:
+        _end_run(profiler, tokens)
+        _finish_run(profiler)
+
+
+def profile_run(label):
+    """剖析一次完整的采集周期或请求，未开启剖析时不做任何事"""
+    if not PROFILING_CONFIG['enabled']:
+        return _NULL_CONTEXT
+    return _profile_run(label)
+
+
+@contextmanager
+def _profile_stage(profiler, name):
+    path = _stage_path.get() + (name,)
+    token = _stage_path.set(path)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        profiler.add_stage(path, time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+        _stage_path.reset(token)
+
+
+def profile_stage(name):
+    """记录一个阶段的墙钟时间和 CPU 时间，不在剖析中时返回空上下文"""
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return _NULL_CONTEXT
+    return _profile_stage(profiler, name)
+
+
+def add_profiling_middleware(app):
+    """为 FastAPI 应用添加按比例抽样的请求剖析中间件"""
+    @app.middleware("http")
+    async def profile_request(request, call_next):
+        if random.random() >= PROFILING_CONFIG['request_sample_rate']:
+            return await call_next(request)
+        profiler, tokens = _begin_run(
+            f"request_{request.method}_{request.url.path}",
+            PROFILING_CONFIG['request_tracemalloc']
+        )
+        try:
+            return await call_next(request)
+        finally:
+            _end_run(profiler, tokens)
+            # 汇总和写文件放到线程中，避免阻塞事件循环上的其他请求和 SSE 订阅者
+            await asyncio.to_thread(_finish_run, profiler)
+
+
+def load_profile(directory):
+    """加载剖析结果目录"""
+    with open(os.path.join(directory, 'stages.json'), 'r', encoding='utf-8') as f:
+        profile = json.load(f)
+    samples = Counter()
+    cpu_path = os.path.join(directory, 'cpu.folded')
+    if os.path.exists(cpu_path):
+        with open(cpu_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                samples[stack] += int(count)
+    profile['samples'] = samples
+    return profile
+
+
+def compare_profiles(before_dir, after_dir, top=15):
+    """比较两次剖析结果：各阶段耗时变化及采样中函数占比变化"""
+    before = load_profile(before_dir)
+    after = load_profile(after_dir)
+
+    stages = []
+    for path in sorted(set(before['stages']) | set(after['stages'])):
+        a = before['stages'].get(path, {'wall': 0.0, 'cpu': 0.0})
+        b = after['stages'].get(path, {'wall': 0.0, 'cpu': 0.0})
+        stages.append({
+            'stage': path,
+            'wall_before': a['wall'],
+            'wall_after': b['wall'],
+            'wall_delta': b['wall'] - a['wall'],
+            'cpu_before': a['cpu'],
+            'cpu_after': b['cpu'],
+            'cpu_delta': b['cpu'] - a['cpu']
+        })
+
+    def leaf_share(samples):
+        total = sum(samples.values()) or 1
+        leaves = Counter()
+        for stack, count in samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return {leaf: count / total for leaf, count in leaves.items()}
+
+    before_share = leaf_share(before['samples'])
+    after_share = leaf_share(after['samples'])
+    functions = sorted(
+        ({'function': leaf,
+          'share_before': before_share.get(leaf, 0.0),
+          'share_after': after_share.get(leaf, 0.0),
+          'share_delta': after_share.get(leaf, 0.0) - before_share.get(leaf, 0.0)}
+         for leaf in set(before_share) | set(after_share)),
+        key=lambda x: abs(x['share_delta']),
+        reverse=True
+    )[:top]
+
+    return {
+        'before': before_dir,
+        'after': after_dir,
+        'memory_peak_before': before.get('memory_peak'),
+        'memory_peak_after': after.get('memory_peak'),
+        'stages': stages,
+        'functions': functions
+    }
+
+
+def print_comparison(result):
+    print(f"比较: {result['before']} -> {result['after']}")
+    print(f"内存峰值: {result['memory_peak_before']} -> {result['memory_peak_after']}")
+    print(f"\n{'阶段':<60} {'墙钟(s)':>22} {'CPU(s)':>22}")
+    for stage in result['stages']:
+        print(f"{stage['stage']:<60} "
+              f"{stage['wall_before']:>8.3f} -> {stage['wall_after']:>8.3f} "
+              f"{stage['cpu_before']:>8.3f} -> {stage['cpu_after']:>8.3f}")
+    print(f"\n{'函数（采样自身占比）':<80} {'变化':>20}")
+    for func in result['functions']:
+        print(f"{func['function']:<80} {func['share_before']:>6.1%} -> {func['share_after']:>6.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="剖析结果工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compare_parser = subparsers.add_parser('compare', help="比较两次剖析结果")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    print_comparison(compare_profiles(args.before, args.after, args.top))
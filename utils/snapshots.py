@@ -0,0 +1,310 @@
+# utils/snapshots.py
+import copy
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from config.config import SNAPSHOT_CONFIG
+from utils.helpers import write_json_atomic
+
+# 列表中用于识别同一条记录的字段（财务报表按报告期，行情按交易日）
+RECORD_KEYS = ['fiscalDateEnding', 'Date']
+
+
+def _record_key(items):
+    """如果列表中的每条记录都能由同一个字段唯一识别，返回该字段"""
+    if not items or not all(isinstance(item, dict) for item in items):
+        return None
+    for key in RECORD_KEYS:
+        values = [item.get(key) for item in items]
+        if all(isinstance(value, str) for value in values) and len(set(values)) == len(values):
+            return key
+    return None
+
+
+def compute_delta(old, new):
+    """计算 new 相对 old 的增量，二者相同时返回 None
+
+    增量格式：
+    - {'v': value}：整体替换
+    - {'d': {key: delta}, 'r': [key]}：字典按键修改/删除
+    - {'l': field, 'i': {id: delta}, 'r': [id], 'o': [id] | 'desc' | 'asc'}：按记录字段识别的列表
+    """
+    if old == new:
+        return None
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = {}
+        for key, value in new.items():
+            if key not in old:
+                changes[key] = {'v': value}
+            else:
+                delta = compute_delta(old[key], value)
+                if delta is not None:
+                    changes[key] = delta
+        delta = {'d': changes}
+        removed = [key for key in old if key not in new]
+        if removed:
+            delta['r'] = removed
+        return delta
+
+    if isinstance(old, list) and isinstance(new, list):
+        field = _record_key(new)
+        if field and field == _record_key(old):
+            old_items = {item[field]: item for item in old}
+            changes = {}
+            for item in new:
+                item_id = item[field]
+                if item_id not in old_items:
+                    changes[item_id] = {'v': item}
+                else:
+                    delta = compute_delta(old_items[item_id], item)
+                    if delta is not None:
+                        changes[item_id] = delta
+            delta = {'l': field, 'i': changes}
+            new_ids = [item[field] for item in new]
+            removed = [item_id for item_id in old_items if item_id not in set(new_ids)]
+            if removed:
+                delta['r'] = removed
+            if new_ids != [item[field] for item in old if item[field] not in removed]:
+                # 按日期排序的列表只记录排序方向，避免每次保存完整顺序
+                if new_ids == sorted(new_ids, reverse=True):
+                    delta['o'] = 'desc'
+                elif new_ids == sorted(new_ids):
+                    delta['o'] = 'asc'
+                else:
+                    delta['o'] = new_ids
+            return delta
+
+    return {'v': new}
+
+
+def apply_delta(old, delta):
+    """将增量应用到 old 上，返回新的对象（不修改 old）"""
+    if delta is None:
+        return old
+    if 'v' in delta:
+        return copy.deepcopy(delta['v'])
+
+    if 'd' in delta:
+        result = {key: value for key, value in old.items() if key not in delta.get('r', [])}
+        for key, change in delta['d'].items():
+            result[key] = apply_delta(result.get(key), change)
+        return result
+
+    field = delta['l']
+    removed = set(delta.get('r', []))
+    items = {item[field]: item for item in old if item[field] not in removed}
+    order = delta.get('o')
+    if not isinstance(order, list):
+        order = [item[field] for item in old if item[field] not in removed]
+    order = list(order)
+    for item_id, change in delta['i'].items():
+        items[item_id] = apply_delta(items.get(item_id), change)
+        if item_id not in order:
+            order.append(item_id)
+    if delta.get('o') in ('desc', 'asc'):
+        order.sort(reverse=delta['o'] == 'desc')
+    return [items[item_id] for item_id in order]
+
+
+def _to_local_naive(value):
+    """带时区的时间转换为本地时间并去掉时区，与 collection_time 保持一致"""
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def parse_as_of(as_of):
+    """解析 as_of 参数，只给出日期时视为当天结束"""
+    try:
+        if len(as_of) == 10:
+            return datetime.fromisoformat(as_of) + timedelta(days=1) - timedelta(microseconds=1)
+        return _to_local_naive(datetime.fromisoformat(as_of))
+    except (TypeError, ValueError):
+        raise ValueError(f"无效的 as_of 参数: {as_of}，应为 YYYY-MM-DD 或 ISO 时间")
+
+
+class SnapshotStore:
+    """数据集版本快照存储
+
+    每次保存记录为相对上一版本的增量，每隔 checkpoint_interval 个版本保存
+    一个完整检查点。按时间查询时从最近的检查点开始依次应用增量重建数据。
+    """
+
+    def __init__(self, dataset, base_dir=None, checkpoint_interval=None, compact_after_days=None):
+        self.dataset = dataset
+        self.directory = os.path.join(base_dir or SNAPSHOT_CONFIG['dir'], dataset)
+        self.index_path = os.path.join(self.directory, 'index.json')
+        self.checkpoint_interval = checkpoint_interval or SNAPSHOT_CONFIG['checkpoint_interval']
+        self.compact_after_days = compact_after_days or SNAPSHOT_CONFIG['compact_after_days']
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def load_index(self):
+        """加载版本索引"""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'dataset': self.dataset, 'generation': 0, 'versions': []}
+
+    def record(self, data):
+        """记录新版本，数据与上一版本完全相同时不新增版本"""
+        with self._lock:
+            index = self.load_index()
+            versions = index['versions']
+            previous = self._rebuild(versions, len(versions) - 1) if versions else None
+            if versions and previous == data:
+                return versions[-1]
+
+            version = versions[-1]['version'] + 1 if versions else 1
+            since_checkpoint = 0
+            for entry in reversed(versions):
+                if entry['kind'] == 'full':
+                    break
+                since_checkpoint += 1
+            is_checkpoint = not versions or since_checkpoint + 1 >= self.checkpoint_interval
+
+            entry = self._write_version(index, version, data, None if is_checkpoint else previous)
+            entry['collection_time'] = self._timestamp(data)
+            versions.append(entry)
+            write_json_atomic(self.index_path, index)
+
+            if is_checkpoint and versions:
+                self._compact(index)
+            return entry
+
+    def versions(self):
+        """列出所有版本"""
+        return self.load_index()['versions']
+
+    def as_of(self, as_of):
+        """获取指定时间点的数据视图，没有更早的版本时返回 None"""
+        target = parse_as_of(as_of)
+        with self._lock:
+            versions = self.load_index()['versions']
+            position = None
+            for i, entry in enumerate(versions):
+                if datetime.fromisoformat(entry['collection_time']) <= target:
+                    position = i
+            if position is None:
+                return None
+            return self._rebuild(versions, position)
+
+    def _rebuild(self, versions, position):
+        """从 position 之前最近的检查点开始应用增量，重建该版本的数据"""
+        target = versions[position]
+        cache_key = (target['version'], target['file'])
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+
+        start = position
+        while versions[start]['kind'] != 'full':
+            start -= 1
+
+        data = None
+        for entry in versions[start:position + 1]:
+            with open(os.path.join(self.directory, entry['file']), 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            data = content if entry['kind'] == 'full' else apply_delta(data, content)
+
+        # 只缓存最近重建的少量版本
+        if len(self._cache) >= SNAPSHOT_CONFIG['cache_size']:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[cache_key] = data
+        return data
+
+    def _write_version(self, index, version, data, previous):
+        """写入完整检查点或增量文件"""
+        if previous is None:
+            kind, content = 'full', data
+        else:
+            kind, content = 'delta', compute_delta(previous, data)
+        # 文件名包含压缩代数，压缩时不会覆盖仍被旧索引引用的文件
+        filename = f"v{version:06d}.{kind}.g{index.get('generation', 0)}.json"
+        write_json_atomic(os.path.join(self.directory, filename), content, indent=None)
+        return {'version': version, 'kind': kind, 'file': filename}
+
+    def _compact(self, index):
+        """压缩旧版本：超过保留期的版本每天只保留最后一个
+
+        as_of 查询以日期为粒度，同一天内被覆盖的版本不会被查询到。只有紧跟在
+        被删除版本之后的增量需要重新计算，其余版本文件保持不变；重建时按顺序
+        流式应用增量，内存中只保留当前版本和上一个保留版本。
+        """
+        versions = index['versions']
+        cutoff = datetime.now() - timedelta(days=self.compact_after_days)
+        keep = []
+        for i, entry in enumerate(versions):
+            collected = datetime.fromisoformat(entry['collection_time'])
+            next_entry = versions[i + 1] if i + 1 < len(versions) else None
+            same_day_later = (
+                next_entry is not None
+                and collected < cutoff
+                and next_entry['collection_time'][:10] == entry['collection_time'][:10]
+            )
+            keep.append(not same_day_later)
+        if all(keep):
+            return
+
+        print(f"压缩 {self.dataset} 快照: 删除 {keep.count(False)} 个同日旧版本")
+        first_dropped = keep.index(False)
+        last_rewrite = max(i + 1 for i, kept in enumerate(keep) if not kept)
+        index['generation'] = index.get('generation', 0) + 1
+
+        # 从第一个被删除版本之前最近的检查点开始流式重建
+        start = first_dropped
+        while versions[start]['kind'] != 'full':
+            start -= 1
+
+        compacted = [entry for entry, kept in zip(versions[:start], keep[:start]) if kept]
+        data = None
+        previous_kept = None
+        for i in range(start, last_rewrite + 1):
+            entry = versions[i]
+            with open(os.path.join(self.directory, entry['file']), 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            data = content if entry['kind'] == 'full' else apply_delta(data, content)
+            if not keep[i]:
+                continue
+            if entry['kind'] == 'delta' and i > 0 and not keep[i - 1]:
+                # 前一个版本被删除，需要相对上一个保留版本重新计算增量
+                new_entry = self._write_version(index, entry['version'], data, previous_kept)
+                new_entry['collection_time'] = entry['collection_time']
+                compacted.append(new_entry)
+            else:
+                compacted.append(entry)
+            previous_kept = data
+        compacted.extend(versions[last_rewrite + 1:])
+
+        old_files = {entry['file'] for entry in versions}
+        index['versions'] = compacted
+        write_json_atomic(self.index_path, index)
+        self._cache.clear()
+        for filename in old_files - {entry['file'] for entry in compacted}:
+            os.remove(os.path.join(self.directory, filename))
+
+    @staticmethod
+    def _timestamp(data):
+        collection_time = data.get('collection_time') if isinstance(data, dict) else None
+        try:
+            return _to_local_naive(datetime.fromisoformat(collection_time)).isoformat()
+        except (TypeError, ValueError):
+            return datetime.now().isoformat()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(dataset, create=True):
+    """获取数据集对应的快照存储（同一进程内共享）
+
+    create 为 False 时，数据集还没有快照目录则返回 None，不创建存储。
+    """
+    with _stores_lock:
+        if dataset not in _stores:
+            if not create and not os.path.isdir(os.path.join(SNAPSHOT_CONFIG['dir'], dataset)):
+                return None
+            _stores[dataset] = SnapshotStore(dataset)
+        return _stores[dataset]